@@ -1,80 +1,228 @@
-import json
 import logging
 import os
-from datetime import datetime, timedelta
-from typing import Dict
-
-import pytz
-from azure.storage.blob import BlobServiceClient
-
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import orjson
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+from azure.storage.blob import BlobClient, ContainerClient
+from cachetools import TTLCache
+
+from blob_storage.uploader import JSON_CONTENT_SETTINGS
 from shared.utils import parse_iso_datetime
 
-CONTAINER_NAME = os.environ.get("BLOB_CONTAINER_NAME", "sensor-data")
 ALERT_EXPIRATION_MINUTES = int(os.environ.get("ALERT_EXPIRATION_MINUTES", 360))
+ALERT_CACHE_SECONDS = int(os.environ.get("ALERT_CACHE_SECONDS", 60))
+
+_ALERT_TTL = timedelta(minutes=ALERT_EXPIRATION_MINUTES)
+_UTC = timezone.utc
+
+# In-process copy of each device's alert log, refreshed from Blob Storage at most
+# once per ALERT_CACHE_SECONDS and written through by put_recent_alerts
+_ALERT_CACHE = TTLCache(maxsize=2048, ttl=ALERT_CACHE_SECONDS)
+_ALERT_CACHE_LOCK = threading.Lock()
 
 
-def get_recent_alerts(coreid: str, blob_client: BlobServiceClient) -> Dict[str, str]:
+def get_recent_alerts(
+    coreid: str, container_client: ContainerClient
+) -> Tuple[Dict[str, str], Optional[str]]:
     """
     Retrieves recent alert logs for a given sensor core ID from Blob Storage.
 
     This function loads the alert history file stored at 'alerts/{coreid}.json',
     which contains a dictionary mapping alert reasons to their latest timestamps.
     It filters out entries that are older than the expiration threshold defined by
-    the ALERT_EXPIRATION_MINUTES environment variable.
+    the ALERT_EXPIRATION_MINUTES environment variable. Logs read or written by this
+    worker within the last ALERT_CACHE_SECONDS are served from memory.
 
     Args:
         coreid (str): The sensor device core ID used to locate the alert log file.
-        blob_client (BlobServiceClient): Azure BlobServiceClient used to access blob storage.
+        container_client (ContainerClient): Azure ContainerClient for the sensor data container.
 
     Returns:
-        Dict[str, str]: Filtered alert dictionary with recent (non-expired) alerts.
+        Tuple[Dict[str, str], Optional[str]]: Filtered alert dictionary with recent
+        (non-expired) alerts, and the ETag of the log it was read from (None if the
+        log does not exist yet or could not be read).
     """
-    blob_path = f"alerts/{coreid}.json"
     result = {}
+    etag = None
 
     try:
-        blob = blob_client.get_blob_client(container=CONTAINER_NAME, blob=blob_path)
-        if not blob.exists():
-            return {}
-
-        content = blob.download_blob().readall()
-        alerts = json.loads(content)
-
-        now = datetime.now(pytz.utc)
-        for reason, timestamp in alerts.items():
-            if not timestamp or not reason:
-                continue
-
-            try:
-                dt = parse_iso_datetime(timestamp)
-                if now - dt < timedelta(minutes=ALERT_EXPIRATION_MINUTES):
-                    result[reason] = timestamp
-            except ValueError:
-                continue
+        alerts, etag = _load_alert_log(coreid, container_client)
+        result = _drop_expired(alerts)
 
     except Exception as e:
         logging.warning(f"Failed to load recent alerts for {coreid}: {e}")
 
-    return result
+    return result, etag
 
 
-def upload_alert_log(alert_log: Dict[str, str], coreid: str, blob_client: BlobServiceClient) -> None:
+def put_recent_alerts(
+    coreid: str,
+    alert_log: Dict[str, str],
+    container_client: ContainerClient,
+    etag: Optional[str] = None,
+) -> None:
     """
     Uploads the updated alert log for a given sensor core ID to Blob Storage.
 
+    Meant to be called once per invocation with every alert recorded in it, so
+    several triggered reasons still cost a single blob write.
+
     This function stores the alert history as a JSON file at 'alerts/{coreid}.json',
     containing a dictionary that maps alert reasons to their most recent timestamps.
-    If a log already exists, it is overwritten with the new contents.
+
+    The write is conditional on the ETag returned by get_recent_alerts (or on the
+    log not existing yet, when no ETag is given), so concurrent invocations for the
+    same device do not clobber each other. If another writer got there first, the
+    log is fetched again, its expired entries are dropped, the newer timestamp of
+    each reason is kept, and the upload is retried once; it is skipped if the
+    remote log already holds exactly that result.
 
     Args:
-        alert_log (Dict[str, str]): Dictionary of alert reasons and their timestamps.
         coreid (str): The sensor device core ID used as the log file name.
-        blob_client (BlobServiceClient): Azure BlobServiceClient used to upload the log.
+        alert_log (Dict[str, str]): Dictionary of alert reasons and their timestamps.
+        container_client (ContainerClient): Azure ContainerClient used to upload the log.
+        etag (Optional[str]): ETag of the log the alerts were read from, if any.
+
+    Raises:
+        ResourceModifiedError, ResourceExistsError: If the retried upload also conflicts.
     """
-    blob_name = f"alerts/{coreid}.json"
-    json_data = json.dumps(alert_log, indent=2)
+    try:
+        _put_alert_log(alert_log, coreid, container_client, etag)
+        return
+    except (ResourceModifiedError, ResourceExistsError):
+        logging.info(f"Alert log for {coreid} changed concurrently, merging and retrying")
+
+    remote, etag = _download_alert_log(coreid, container_client)
+    merged = _drop_expired(remote)
+    for reason, timestamp in _drop_expired(alert_log).items():
+        current = merged.get(reason)
+        if current is None or parse_iso_datetime(timestamp) > parse_iso_datetime(current):
+            merged[reason] = timestamp  # keep the most recent alert for each reason
+
+    if merged == remote:
+        with _ALERT_CACHE_LOCK:
+            _ALERT_CACHE[coreid] = (remote, etag)
+        return
+
+    _put_alert_log(merged, coreid, container_client, etag)
+
+
+def _drop_expired(alerts: Dict[str, str]) -> Dict[str, str]:
+    """
+    Returns the alerts newer than the ALERT_EXPIRATION_MINUTES cutoff, skipping
+    empty or unparseable entries.
+    """
+    result = {}
+
+    cutoff = datetime.now(_UTC) - _ALERT_TTL
+    for reason, timestamp in alerts.items():
+        if not timestamp or not reason:
+            continue
+
+        try:
+            dt = parse_iso_datetime(timestamp)
+            if dt > cutoff:
+                result[reason] = timestamp
+        except ValueError:
+            continue
+
+    return result
 
-    container_client = blob_client.get_container_client(CONTAINER_NAME)
-    container_client.upload_blob(
-        name=blob_name, data=json_data, overwrite=True, encoding="utf-8"
+
+def _put_alert_log(
+    alert_log: Dict[str, str],
+    coreid: str,
+    container_client: ContainerClient,
+    etag: Optional[str],
+) -> None:
+    """
+    Uploads the alert log if the blob still matches the given ETag (or is missing
+    when no ETag is given) and writes the result through to the in-process cache.
+    """
+    json_data = orjson.dumps(alert_log)
+
+    if etag:
+        condition = {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+    else:
+        condition = {"match_condition": MatchConditions.IfMissing}
+
+    blob = _get_alert_blob(container_client, coreid)
+    response = blob.upload_blob(
+        json_data,
+        length=len(json_data),
+        overwrite=True,
+        max_concurrency=1,
+        content_settings=JSON_CONTENT_SETTINGS,
+        **condition,
     )
+
+    with _ALERT_CACHE_LOCK:
+        _ALERT_CACHE[coreid] = (dict(alert_log), response.get("etag"))
+
+
+def _load_alert_log(
+    coreid: str, container_client: ContainerClient
+) -> Tuple[Dict[str, str], Optional[str]]:
+    """
+    Returns the unfiltered alert log and its ETag, from the in-process cache if fresh.
+
+    Falls back to downloading 'alerts/{coreid}.json' and caches the result, including
+    an empty log when the blob does not exist yet. The returned dict must not be mutated.
+    """
+    with _ALERT_CACHE_LOCK:
+        cached = _ALERT_CACHE.get(coreid)
+    if cached is not None:
+        return cached
+
+    alerts, etag = _download_alert_log(coreid, container_client)
+
+    with _ALERT_CACHE_LOCK:
+        _ALERT_CACHE[coreid] = (alerts, etag)
+
+    return alerts, etag
+
+
+def _download_alert_log(
+    coreid: str, container_client: ContainerClient
+) -> Tuple[Dict[str, str], Optional[str]]:
+    """
+    Downloads the alert log and its ETag from Blob Storage, or ({}, None) if it does not exist.
+
+    A log that cannot be decoded into a dict is treated as empty but keeps its ETag,
+    so the next conditional upload overwrites the bad content.
+    """
+    blob = _get_alert_blob(container_client, coreid)
+    try:
+        downloader = blob.download_blob()
+    except ResourceNotFoundError:
+        return {}, None  # no alerts logged yet for this device
+
+    etag = downloader.properties.etag
+    try:
+        alerts = orjson.loads(downloader.readall())
+    except orjson.JSONDecodeError as e:
+        logging.warning(f"Alert log for {coreid} is corrupt, it will be overwritten: {e}")
+        return {}, etag
+
+    if not isinstance(alerts, dict):
+        logging.warning(f"Alert log for {coreid} is not a dictionary, it will be overwritten")
+        return {}, etag
+
+    return alerts, etag
+
+
+@lru_cache(maxsize=2048)
+def _get_alert_blob(container_client: ContainerClient, coreid: str) -> BlobClient:
+    """
+    Returns the BlobClient for a device's alert log ('alerts/{coreid}.json'), cached per core ID.
+    """
+    return container_client.get_blob_client(f"alerts/{coreid}.json")
@@ -6,27 +6,30 @@ Stores files with timestamped filenames
 import json
 import logging
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any
 
-import pytz
-from azure.core.exceptions import ResourceExistsError
-from azure.storage.blob import BlobServiceClient
+import orjson
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import ContainerClient, ContentSettings
 
 
 CONTAINER_NAME = os.environ.get("BLOB_CONTAINER_NAME", "sensor-data")
+JSON_CONTENT_SETTINGS = ContentSettings(content_type="application/json")
 
 
-def upload_to_blob(parsed: Dict[str, Any], blob_client: BlobServiceClient):
+def upload_to_blob(parsed: Dict[str, Any], container_client: ContainerClient):
     """
     Uploads a parsed payload dictionary to Azure Blob Storage.
 
     This function converts the dictionary to JSON, generates a blob name from metadata,
-    and stores it in the defined container, creating it if necessary.
+    and stores it in the defined container. The container is created at startup; if it
+    is missing at upload time (e.g. startup creation failed), it is created and the
+    upload retried once.
 
     Args:
         parsed (Dict[str, Any]): Parsed payload containing sensor data and metadata.
-        blob_client (BlobServiceClient): Azure BlobServiceClient instance for accessing storage.
+        container_client (ContainerClient): Azure ContainerClient for the sensor data container.
 
     Returns:
         str: Full blob name used for storing the uploaded JSON data.
@@ -45,26 +48,23 @@ def upload_to_blob(parsed: Dict[str, Any], blob_client: BlobServiceClient):
 
     # Convert to JSON
     try:
-        json_data = json.dumps(parsed, indent=2)
-    except (TypeError, ValueError) as e:
-        raise ValueError(f"Data is not JSON serializable: {e}")
+        json_data = orjson.dumps(parsed)
+    except TypeError:
+        # orjson rejects integers beyond 64 bits, which the parser may still produce
+        try:
+            json_data = json.dumps(parsed, separators=(",", ":")).encode()
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Data is not JSON serializable: {e}")
 
-    # Upload to azure
+    # Upload to azure (container is normally created once at startup, see function_app)
     try:
-        container_client = blob_client.get_container_client(CONTAINER_NAME)
-
-        # Ensure container exists (create if needed)
         try:
-            container_client.create_container()
-        except ResourceExistsError:
-            pass  # Container already exists, which is fine
-        except Exception as e:
-            print(f"Warning: Could not create container: {e}")
-
-        # Upload blob
-        container_client.upload_blob(
-            name=blob_name, data=json_data, overwrite=True, encoding="utf-8"
-        )
+            _upload_json(container_client, blob_name, json_data)
+        except ResourceNotFoundError:
+            logging.warning(f"Container missing while uploading {blob_name}, creating it")
+            ensure_container(container_client)
+            _upload_json(container_client, blob_name, json_data)
+
         logging.info(f"Uploaded to blob: {blob_name}")
         return blob_name
 
@@ -73,6 +73,36 @@ def upload_to_blob(parsed: Dict[str, Any], blob_client: BlobServiceClient):
         raise
 
 
+def ensure_container(container_client: ContainerClient) -> None:
+    """
+    Creates the sensor data container if it does not exist yet.
+
+    Called once at startup and again by upload_to_blob when the container is missing,
+    so a failed startup attempt does not break every later upload.
+    """
+    try:
+        container_client.create_container()
+    except ResourceExistsError:
+        pass  # Container already exists, which is fine
+    except Exception as e:
+        logging.warning(f"Could not create container: {e}")
+
+
+def _upload_json(container_client: ContainerClient, blob_name: str, json_data: bytes) -> None:
+    """
+    Uploads serialized JSON, taking the single-PUT path for small blobs
+    (explicit length and single-threaded upload).
+    """
+    container_client.upload_blob(
+        name=blob_name,
+        data=json_data,
+        length=len(json_data),
+        overwrite=True,
+        max_concurrency=1,
+        content_settings=JSON_CONTENT_SETTINGS,
+    )
+
+
 def _get_blob_folder(parsed: Dict[str, Any]) -> str:
     """
     Generates the blob folder path based on the payload type and structure.
@@ -104,7 +134,11 @@ def _get_blob_name(parsed: Dict[str, Any], blob_folder: str):
     # Maybe we can use the second function app to save that table into json on the blob
     # Maybe we can hardcode it in this app (no updates)
     # Maybe we can just leave the coreid for unparsed files (expect low number of them)
-    upload_timestamp = datetime.now(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+    now = datetime.now(timezone.utc)
+    upload_timestamp = (
+        f"{now.year:04d}{now.month:02d}{now.day:02d}"
+        f"T{now.hour:02d}{now.minute:02d}{now.second:02d}Z"
+    )  # same as strftime("%Y%m%dT%H%M%SZ"), without the strftime overhead
     box_id = parsed.get("box_id") or parsed.get("coreid", "unknown")
 
     return f"{blob_folder}/{box_id}_{upload_timestamp}.json"
@@ -1,12 +1,18 @@
+import asyncio
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
 
 import azure.functions as func
+import orjson
+import requests
+from azure.core.pipeline.transport import RequestsTransport
 from azure.storage.blob import BlobServiceClient
+from requests.adapters import HTTPAdapter
 
-from blob_storage.uploader import upload_to_blob
-from blob_storage.alert_log import upload_alert_log
+from blob_storage.uploader import CONTAINER_NAME, ensure_container, upload_to_blob
 from shared.alerts import check_and_alert
 from shared.parser import parse_payload_data
 
@@ -16,16 +22,34 @@ CONNECTION_STRING = os.environ.get("BLOB_CONNECTION_STRING")
 if not CONNECTION_STRING:
     raise ValueError("BLOB_CONNECTION_STRING environment variable is required")
 
+# Shared HTTP session so every invocation reuses pooled TCP/TLS connections
+_shared_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+_shared_session = requests.Session()
+_shared_session.mount("https://", _shared_adapter)
+_shared_session.mount("http://", _shared_adapter)
+
+BLOB_CLIENT = BlobServiceClient.from_connection_string(
+    CONNECTION_STRING, transport=RequestsTransport(session=_shared_session)
+)
+CONTAINER_CLIENT = BLOB_CLIENT.get_container_client(CONTAINER_NAME)
+
+ensure_container(CONTAINER_CLIENT)
+
+# Dedicated pool for the blocking blob work of each invocation, so the alert
+# checks (with their alert-log read/write) and the payload PUT overlap on the
+# shared connection pool
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="webhook-io")
+
 app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
 
 
 @app.route(route="webhook", methods=["POST"])
-def webhook_handler(req: func.HttpRequest) -> func.HttpResponse:
+async def webhook_handler(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
 
     try:
-        payload = req.get_json()
-    except ValueError:
+        payload = orjson.loads(req.get_body())
+    except orjson.JSONDecodeError:
         return func.HttpResponse(
             json.dumps({"error": "Invalid JSON"}),
             status_code=400,
@@ -45,27 +69,19 @@ def webhook_handler(req: func.HttpRequest) -> func.HttpResponse:
     parsed["published_at"] = payload.get("published_at", "")
     parsed["coreid"] = payload.get("coreid", "")
 
-    blob_client = BlobServiceClient.from_connection_string(CONNECTION_STRING)
-
-    try:
-        updated_alert_log = check_and_alert(parsed, blob_client)
-    except Exception as e:
-        logging.error(f"Failed to check and alert: {e}")
-        pass
-
-    if updated_alert_log:
-        try:
-            coreid = parsed.get("coreid", "no_coreid")
-            upload_alert_log(updated_alert_log, coreid, blob_client)
-        except Exception as e:
-            logging.error(f"Failed to upload updated alert log: {e}")
+    # Alerting and payload upload are independent, so run the blocking SDK calls
+    # concurrently in worker threads and keep the event loop free
+    loop = asyncio.get_running_loop()
+    _, upload_result = await asyncio.gather(
+        loop.run_in_executor(_EXECUTOR, _process_alerts, parsed),
+        loop.run_in_executor(_EXECUTOR, upload_to_blob, parsed, CONTAINER_CLIENT),
+        return_exceptions=True,
+    )
 
-    try:
-        upload_to_blob(parsed, blob_client)
-    except Exception as e:
-        logging.exception("Failed to upload to blob.")
+    if isinstance(upload_result, Exception):
+        logging.error("Failed to upload to blob.", exc_info=upload_result)
         return func.HttpResponse(
-            json.dumps({"error": "Failed to upload to blob", "detail": str(e)}),
+            json.dumps({"error": "Failed to upload to blob", "detail": str(upload_result)}),
             status_code=500,
             mimetype="application/json",
         )
@@ -75,3 +91,15 @@ def webhook_handler(req: func.HttpRequest) -> func.HttpResponse:
         status_code=200,
         mimetype="application/json",
     )
+
+
+def _process_alerts(parsed: Dict[str, Any]) -> None:
+    """
+    Runs the alert checks for a parsed payload (which also persist the alert log).
+
+    Failures are logged and never propagated, so alerting cannot fail the webhook.
+    """
+    try:
+        check_and_alert(parsed, CONTAINER_CLIENT)
+    except Exception as e:
+        logging.error(f"Failed to check and alert: {e}")
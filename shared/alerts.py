@@ -1,14 +1,23 @@
+import atexit
+import functools
 import logging
 import os
+import queue
 import smtplib
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timezone
 from email.message import EmailMessage
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import pytz
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import ContainerClient
+from cachetools import TTLCache
 
-from blob_storage.alert_log import get_recent_alerts
+from blob_storage.alert_log import (
+    ALERT_EXPIRATION_MINUTES,
+    get_recent_alerts,
+    put_recent_alerts,
+)
 from shared.utils import parse_iso_datetime
 
 EMAIL_HOST = os.getenv("EMAIL_HOST")
@@ -18,12 +27,36 @@ EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_RECIPIENT_DEVELOP = os.getenv("EMAIL_RECIPIENT_DEVELOP")
 EMAIL_RECIPIENT_DEPLOY = os.getenv("EMAIL_RECIPIENT_DEPLOY")
 
+SMTP_TIMEOUT_SECONDS = 10  # fail fast instead of hanging on an unresponsive mail server
+SMTP_IDLE_CHECK_SECONDS = 30  # probe a reused SMTP connection with NOOP after this idle time
+
+_smtp_connect = functools.partial(
+    smtplib.SMTP, EMAIL_HOST, EMAIL_PORT, timeout=SMTP_TIMEOUT_SECONDS
+)
+
+# Alert emails are delivered by a background worker so SMTP never delays the webhook
+_EMAIL_QUEUE: "queue.Queue[Optional[EmailMessage]]" = queue.Queue()  # None stops the worker
+_email_worker_thread: Optional[threading.Thread] = None
+_email_worker_lock = threading.Lock()
+
+# (coreid, reason) pairs this worker emailed within the alert expiration window,
+# so repeats are suppressed without reading the alert log from Blob Storage
+_SENT_ALERTS = TTLCache(maxsize=10_000, ttl=ALERT_EXPIRATION_MINUTES * 60)
+_SENT_ALERTS_LOCK = threading.Lock()
+
 MAX_LATENCY_MINUTES = 30
 
 SUBJECT_PREFFIX = "[SENSOR DATA ALERT TRIGGERED] "
 
 
-def check_and_alert(parsed: Dict[str, Any], blob_client: BlobServiceClient) -> Optional[Dict[str, str]]:
+def check_and_alert(
+    parsed: Dict[str, Any],
+    container_client: ContainerClient,
+    *,
+    _prefix: str = SUBJECT_PREFFIX,
+    _deploy: Optional[str] = EMAIL_RECIPIENT_DEPLOY,
+    _develop: Optional[str] = EMAIL_RECIPIENT_DEVELOP,
+) -> Optional[Dict[str, str]]:
     """
     Evaluates parsed sensor data and triggers alert emails based on predefined conditions.
 
@@ -34,236 +67,376 @@ def check_and_alert(parsed: Dict[str, Any], blob_client: BlobServiceClient) -> O
     - Malformed or unrecognized formats
 
     It avoids sending duplicate alerts by checking recent alert logs in Blob Storage
-    (one per core ID). If no recent alert exists for the same reason, an email is sent
-    and the alert is recorded with a UTC timestamp.
+    (one per core ID). The log is only read when a check fires. If no recent alert
+    exists for the same reason, an email is sent and the alert is recorded with a
+    UTC timestamp. All alerts recorded in a call are written back to the log in a
+    single conditional (ETag) upload.
+
+    The keyword-only underscore arguments bind the subject prefix and recipients as
+    locals at definition time; they are not meant to be passed by callers.
 
     Args:
         parsed (Dict[str, Any]): Parsed sensor payload containing metadata and raw content.
-        blob_client (BlobServiceClient): Authenticated client used to read alert history.
+        container_client (ContainerClient): Container client used to read alert history.
 
     Returns:
         Optional[Dict[str, str]]: Dictionary mapping triggered alert reasons to timestamps
-        (ISO 8601), or None if no alerts were triggered.
+        (ISO 8601), as written to the alert log, or None if no alerts were triggered.
     """
     alerts_triggered = False
+    emails = []  # (subject, body, recipients), sent over a single SMTP session
+    details = None  # payload details, rendered at most once per message
 
     # If no coreid in the message send an alert to deployment
     coreid = parsed.get("coreid", "no_coreid")
     if coreid == "no_coreid":
-        _send_alert_email(
-            subject=SUBJECT_PREFFIX + "No coreid in the incoming sensor data",
-            body=_compose_body(parsed, alert={}),
-            recipient=EMAIL_RECIPIENT_DEVELOP,
+        details = _compose_details(parsed)
+        emails.append(
+            (
+                _prefix + "No coreid in the incoming sensor data",
+                _compose_body(details, alert={}),
+                _develop,
+            )
         )
 
-    # Deploy team checks
-    deploy_alert = None
-    latency = None
-
-    deploy_checks = [_check_invalid, _check_error]
-    for check in deploy_checks:
-        deploy_alert = check(parsed)  # alert: dict if triggered else None
-        if deploy_alert:
-            break  # alerts ordered by priority
-
-    latency = _check_latency(parsed)  # latency: dict if triggered else None
-
-    if deploy_alert and latency:
-        deploy_alert["latency"] = latency["summary"]
-    elif not deploy_alert and latency:
-        deploy_alert = latency
+    # Single switch on datatype; the builders run only when their alert applies
+    datatype = parsed.get("datatype")
 
-    # Develop team checks
-    develop_alert = None
+    # Deploy and develop team checks (plain comparisons, run first)
+    deploy_alert = (
+        _build_invalid_alert() if datatype == "invalid"
+        else _build_error_alert(parsed) if datatype == "error"
+        else None
+    )
+    develop_alert = (
+        _build_unknown_alert() if datatype == "unknown"
+        else _build_malformed_alert(parsed, datatype) if parsed.get("malformed") is True
+        else None
+    )
+
+    # Latency check (parses two timestamps), only for payloads carrying both of them.
+    # It never replaces a deploy alert, only adds its summary to it.
+    if parsed.get("timestamp") and parsed.get("published_at"):
+        latency = _check_latency(parsed)  # latency: dict if triggered else None
 
-    develop_checks = [_check_unknown, _check_malformed]
-    for check in develop_checks:
-        develop_alert = check(parsed)
-        if develop_alert:
-            break
+        if deploy_alert and latency:
+            deploy_alert["latency"] = latency["summary"]
+        elif not deploy_alert and latency:
+            deploy_alert = latency
 
-    # Exit if not alerts triggered
+    # Exit if not alerts triggered. This is the common case, and it must not
+    # touch Blob Storage: the alert log is only read (and later rewritten)
+    # when at least one check fired.
     if not deploy_alert and not develop_alert:
+        _send_alert_emails(emails)
+        return None
+
+    # Skip the alert log if this worker itself sent every triggered alert recently
+    reasons = [alert.get("reason") for alert in (deploy_alert, develop_alert) if alert]
+    with _SENT_ALERTS_LOCK:
+        already_sent = all((coreid, reason) in _SENT_ALERTS for reason in reasons)
+
+    if already_sent:
+        logging.warning(
+            "Alerts not sent for reasons %s on coreid '%s' "
+            "because they were already triggered recently.",
+            reasons,
+            coreid,
+        )
+        _send_alert_emails(emails)
         return None
 
     # Check if current device triggered an alert for the same reason recently.
     # Note that the checks to deduplicate alerts are based on device's coreid.
-    recent_alerts = get_recent_alerts(coreid, blob_client)
+    recent_alerts, etag = get_recent_alerts(coreid, container_client)
+
+    # Payload details are identical in every email for this message, render them once
+    if details is None:
+        details = _compose_details(parsed)
 
     # Send an alert email if no alert email was sent recently
-    for alert, recipient in [
-        (deploy_alert, EMAIL_RECIPIENT_DEPLOY),
-        (develop_alert, EMAIL_RECIPIENT_DEVELOP),
-    ]:
+    for alert, recipient in (
+        (deploy_alert, _deploy),
+        (develop_alert, _develop),
+    ):
         if alert:
             reason = alert.get("reason")  # reason must be defined in the alert
             if reason and reason not in recent_alerts:
-                _send_alert_email(
-                    subject=SUBJECT_PREFFIX + alert.get("subject", "No subject"),
-                    body=_compose_body(parsed, alert=alert),
-                    recipients=recipient,
+                emails.append(
+                    (
+                        _prefix + alert.get("subject", "No subject"),
+                        _compose_body(details, alert=alert),
+                        recipient,
+                    )
                 )
-                recent_alerts[reason] = datetime.now(pytz.utc).isoformat()
+                recent_alerts[reason] = datetime.now(timezone.utc).isoformat()
                 alerts_triggered = True
+                with _SENT_ALERTS_LOCK:
+                    _SENT_ALERTS[(coreid, reason)] = recent_alerts[reason]
             else:
                 logging.warning(
-                    f"Alert not sent for reason '{reason}' on coreid '{coreid}' "
-                    "because it was already triggered recently."
+                    "Alert not sent for reason '%s' on coreid '%s' "
+                    "because it was already triggered recently.",
+                    reason,
+                    coreid,
                 )
 
-    return recent_alerts if alerts_triggered else None
+    _send_alert_emails(emails)
+
+    if not alerts_triggered:
+        return None
+
+    try:
+        put_recent_alerts(coreid, recent_alerts, container_client, etag)
+    except Exception as e:
+        logging.error("Failed to upload updated alert log for %s: %s", coreid, e)
+
+    return recent_alerts
 
 
-def _check_invalid(parsed: Dict[str, Any]) -> Optional[Dict[str, str]]:
+def _build_invalid_alert() -> Dict[str, str]:
     """
-    Checks for invalid input data where 'data' is empty or missing.
-    Returns an alert dictionary if triggered, else None.
+    Builds the alert for invalid input data, where 'data' is empty or missing.
     """
-    datatype = parsed.get("datatype")
-    if datatype == "invalid":
-        alert_subject = "Invalid data received"
-        alert_summary = (
-            "Invalid data received: 'data' field must contain a non-empty string."
-        )
+    alert_subject = "Invalid data received"
+    alert_summary = (
+        "Invalid data received: 'data' field must contain a non-empty string."
+    )
 
-        return {
-            "reason": datatype,
-            "subject": alert_subject,
-            "summary": alert_summary,
-        }
-
-    return None
+    return {
+        "reason": "invalid",
+        "subject": alert_subject,
+        "summary": alert_summary,
+    }
 
 
-def _check_unknown(parsed: Dict[str, Any]) -> Optional[Dict[str, str]]:
+def _build_unknown_alert() -> Dict[str, str]:
     """
-    Checks if the data type is unrecognized ('unknown').
-    Returns an alert dictionary if triggered, else None.
+    Builds the alert for an unrecognized data type ('unknown').
     """
-    datatype = parsed.get("datatype")
-    if datatype == "unknown":
-        alert_subject = "Unrecognized data format received"
-        alert_summary = "Unrecognized data format: does not match expected patterns for sensor readings, error logs, or startup messages."
+    alert_subject = "Unrecognized data format received"
+    alert_summary = "Unrecognized data format: does not match expected patterns for sensor readings, error logs, or startup messages."
 
-        return {
-            "reason": datatype,
-            "subject": alert_subject,
-            "summary": alert_summary,
-        }
+    return {
+        "reason": "unknown",
+        "subject": alert_subject,
+        "summary": alert_summary,
+    }
 
-    return None
 
-
-def _check_error(parsed: Dict[str, Any]) -> Optional[Dict[str, str]]:
+def _build_error_alert(parsed: Dict[str, Any]) -> Dict[str, str]:
     """
-    Checks for reported sensor error messages (datatype = 'error').
-    Returns an alert dictionary if triggered, else None.
+    Builds the alert for a reported sensor error message (datatype = 'error').
     """
-    datatype = parsed.get("datatype")
-    if datatype == "error":
-        box_id = parsed.get("box_id", "unknown")
-        error_code = parsed.get("error_code", "E")
-        alert_subject = f"Error {error_code} detected in Box {box_id}"
-
-        return {
-            "reason": error_code,
-            "subject": alert_subject,
-            "summary": alert_subject,
-        }
+    box_id = parsed.get("box_id", "unknown")
+    error_code = parsed.get("error_code", "E")
+    alert_subject = f"Error {error_code} detected in Box {box_id}"
 
-    return None
+    return {
+        "reason": error_code,
+        "subject": alert_subject,
+        "summary": alert_subject,
+    }
 
 
-def _check_malformed(parsed: Dict[str, Any]) -> Optional[Dict[str, str]]:
+def _build_malformed_alert(parsed: Dict[str, Any], datatype: Optional[str]) -> Dict[str, str]:
     """
-    Checks if the payload was marked as malformed during parsing.
-    Returns an alert dictionary if triggered, else None.
+    Builds the alert for a payload marked as malformed during parsing.
     """
-    if parsed.get("malformed") is True:
-        datatype = parsed.get("datatype")
-        parsing_error = parsed.get(
-            "parsing_error",
-            f"Data does not match the expected pattern for type: {datatype}.",
-        )
-        alert_subject = f"Malformed {datatype} data received"
-        alert_summary = f"Parsing error occurred. {parsing_error}."
+    parsing_error = parsed.get(
+        "parsing_error",
+        f"Data does not match the expected pattern for type: {datatype}.",
+    )
+    alert_subject = f"Malformed {datatype} data received"
+    alert_summary = f"Parsing error occurred. {parsing_error}."
 
-        return {
-            "reason": "malformed",
-            "subject": alert_subject,
-            "summary": alert_summary,
-        }
-
-    return None
+    return {
+        "reason": "malformed",
+        "subject": alert_subject,
+        "summary": alert_summary,
+    }
 
 
 def _check_latency(parsed: Dict[str, Any]) -> Optional[Dict[str, str]]:
     """
     Checks if the transmission latency exceeds the configured threshold.
+    The caller only invokes it for payloads carrying both timestamps.
     Returns an alert dictionary if triggered, else None.
     """
-    if parsed.get("timestamp") and parsed.get("published_at"):
+    try:
+        published_at = parse_iso_datetime(parsed["published_at"])
+        # Produced by our parser via datetime.isoformat(), so no 'Z' handling is needed
+        timestamp = datetime.fromisoformat(parsed["timestamp"])
+        latency_minutes = (published_at - timestamp).total_seconds() / 60
+
+        if latency_minutes > MAX_LATENCY_MINUTES:
+            box_id = parsed.get("box_id", "unknown")
+            alert_subject = f"High latency in Box {box_id}"
+            alert_summary = f"High transmission latency: {latency_minutes:.1f} minutes (threshold: {MAX_LATENCY_MINUTES}m)."
+
+            return {
+                "reason": "latency",
+                "subject": alert_subject,
+                "summary": alert_summary,
+            }
+    except Exception as e:
+        logging.warning("Latency check failed: %s", e)
+
+    return None
+
+
+def _send_alert_emails(
+    emails: List[Tuple[str, str, Union[str, List[str]]]],
+    _sender: Optional[str] = EMAIL_SENDER,
+):
+    """
+    Queues a batch of alert emails for delivery by the background email worker.
+
+    Each email is a (subject, body, recipients) tuple. Returns as soon as the messages
+    are queued; delivery and its failures are handled (and logged) by the worker.
+    """
+    if not emails:
+        return
+
+    _start_email_worker()
+
+    for subject, body, recipients in emails:
         try:
-            published_at = parse_iso_datetime(parsed["published_at"])
-            timestamp = parse_iso_datetime(parsed["timestamp"])
-            latency_minutes = (published_at - timestamp).total_seconds() / 60
-
-            if latency_minutes > MAX_LATENCY_MINUTES:
-                box_id = parsed.get("box_id", "unknown")
-                alert_subject = f"High latency in Box {box_id}"
-                alert_summary = f"High transmission latency: {latency_minutes:.1f} minutes (threshold: {MAX_LATENCY_MINUTES}m)."
-
-                return {
-                    "reason": "latency",
-                    "subject": alert_subject,
-                    "summary": alert_summary,
-                }
+            if isinstance(recipients, str):
+                recipients = [recipients]  # normalize recipients to a list
+
+            msg = EmailMessage()
+            msg["From"] = _sender
+            msg["To"] = ", ".join(recipients)
+            msg["Subject"] = subject
+            msg.set_content(body)
         except Exception as e:
-            logging.warning(f"Latency check failed: {e}")
+            logging.error("Failed to build alert email '%s': %s", subject, e)
+            continue
 
-    return None
+        _EMAIL_QUEUE.put(msg)
+
+
+def _start_email_worker():
+    """
+    Starts the daemon thread draining the email queue, once per worker process.
+    """
+    global _email_worker_thread
+    with _email_worker_lock:
+        if _email_worker_thread is None or not _email_worker_thread.is_alive():
+            _email_worker_thread = threading.Thread(
+                target=_email_worker, name="alert-email-worker", daemon=True
+            )
+            _email_worker_thread.start()
+
+
+def _email_worker():
+    """
+    Sends queued alert emails over a long-lived SMTP connection.
+
+    The connection is opened lazily and reused across messages. After being idle
+    for SMTP_IDLE_CHECK_SECONDS it is probed with NOOP and reopened if the server
+    dropped it. If a send still fails, the connection is reopened and the message
+    is retried once before being logged as failed.
+    """
+    smtp = None
+    last_used = 0.0
+    while True:
+        msg = _EMAIL_QUEUE.get()
+        if msg is None:
+            _close_smtp(smtp)
+            _EMAIL_QUEUE.task_done()
+            return
+
+        if smtp is not None and time.monotonic() - last_used > SMTP_IDLE_CHECK_SECONDS:
+            if not _is_smtp_alive(smtp):
+                _close_smtp(smtp)
+                smtp = None
+
+        for attempt in (1, 2):
+            try:
+                if smtp is None:
+                    smtp = _open_smtp()
+                smtp.send_message(msg)
+                last_used = time.monotonic()
+                if logging.getLogger().isEnabledFor(logging.INFO):
+                    logging.info("Alert email sent to: %s | Subject: %s", msg["To"], msg["Subject"])
+                break
+            except Exception as e:
+                _close_smtp(smtp)
+                smtp = None
+                if attempt == 2:
+                    logging.error("Failed to send alert email '%s': %s", msg["Subject"], e)
+        _EMAIL_QUEUE.task_done()
+
+
+def _flush_email_queue(timeout: float = 10.0):
+    """
+    Lets the worker deliver queued emails before the process exits (runs at exit).
+
+    Without this, emails still queued when the Functions host recycles the worker
+    would be lost with the daemon thread.
+    """
+    if _email_worker_thread is None or not _email_worker_thread.is_alive():
+        return
+
+    _EMAIL_QUEUE.put(None)  # processed after everything already queued
+    _email_worker_thread.join(timeout)
+
+
+atexit.register(_flush_email_queue)
 
 
-def _send_alert_email(subject: str, body: str, recipients: Union[str, List[str]]):
+def _open_smtp() -> smtplib.SMTP:
     """
-    Sends an alert email via SMTP to one or multiple recipients.
-    
-    Normalizes recipient(s) and handles secure transmission using STARTTLS.
+    Opens an authenticated SMTP connection using STARTTLS.
+    """
+    smtp = _smtp_connect()
+    smtp.starttls()  # sends EHLO itself when needed
+    smtp.login(EMAIL_SENDER, EMAIL_PASSWORD)
+    return smtp
+
+
+def _is_smtp_alive(smtp: smtplib.SMTP) -> bool:
+    """
+    Checks whether an open SMTP connection still responds to NOOP.
     """
     try:
-        if isinstance(recipients, str):
-            recipients = [recipients]  # normalize recipients to a list
-
-        msg = EmailMessage()
-        msg["From"] = EMAIL_SENDER
-        msg["To"] = ", ".join(recipients)
-        msg["Subject"] = subject
-        msg.set_content(body)
-
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as smtp:
-            smtp.ehlo()
-            smtp.starttls()
-            smtp.login(EMAIL_SENDER, EMAIL_PASSWORD)
-            smtp.send_message(msg)
-
-        logging.info(f"Alert email sent to: {', '.join(recipients)} | Subject: {subject}")
-    except Exception as e:
-        logging.error(f"Failed to send alert email: {e}")
+        return smtp.noop()[0] == 250
+    except Exception:
+        return False
 
 
-def _compose_body(parsed: Dict[str, Any], alert: Dict[str, str]) -> str:
+def _close_smtp(smtp: Optional[smtplib.SMTP]) -> None:
     """
-    Composes the email body from parsed payload and alert context.
+    Closes an SMTP connection, ignoring errors from an already broken one.
+    """
+    if smtp is None:
+        return
+    try:
+        smtp.quit()
+    except Exception:
+        smtp.close()
 
-    Includes metadata like Box ID, Core ID, timestamps, and raw data.
+
+def _compose_body(details: str, alert: Dict[str, str], _prefix: str = SUBJECT_PREFFIX) -> str:
+    """
+    Composes the email body from the alert context and the rendered payload details.
     """
     summary = alert.get("summary", "")
-    latency = "\n" + alert.get("latency") if alert.get("latency") else ""
+    latency = alert.get("latency")
+    latency = f"\n{latency}" if latency else ""
 
-    return f"""{SUBJECT_PREFFIX}
-{summary}{latency}
+    return f"{_prefix}\n{summary}{latency}\n\n{details}"
 
-Box ID: {parsed.get("box_id", "unknown")}
+
+def _compose_details(parsed: Dict[str, Any]) -> str:
+    """
+    Renders the payload part of the email body, shared by all alerts for a message.
+
+    Includes metadata like Box ID, Core ID, timestamps, and raw data.
+    """
+    return f"""Box ID: {parsed.get("box_id", "unknown")}
 Core ID: {parsed.get("coreid", "N/A")}
 Published_at: {parsed.get("published_at", "N/A")}
 Parsed_at: {parsed.get("parsed_at", "N/A")}
@@ -2,7 +2,13 @@ import re
 from datetime import datetime, timezone
 from typing import Dict
 
-import pytz
+_WS_RE = re.compile(r"\s+")
+_STARTUP_RE = re.compile(r"^(\S*?)(\d{6}) (\d{1,2}):(\d{2}) LTE Setup Done")
+_ERROR_RE = re.compile(r"^(\S*?)(\d{6}) (\d{1,2}):(\d{2}) (E\d+)$")
+
+# Translation table deleting digits and commas: a sensor data row is valid after the
+# box ID iff nothing is left once they are removed
+_DIGITS_COMMA = str.maketrans("", "", "0123456789,")
 
 
 def parse_payload_data(raw: str) -> Dict:
@@ -20,32 +26,55 @@ def parse_payload_data(raw: str) -> Dict:
     Returns:
         A dictionary containing the parsed data, or a minimal dict with type 'invalid' or 'unknown' if parsing fails.
     """
+    now = datetime.now(timezone.utc)  # shared by parsed_at and the year inference
+
     if not raw or not isinstance(raw, str):
-        return _get_base_dict("invalid", raw)
+        return _get_base_dict("invalid", raw, now)
+
+    raw = raw.strip()
+    # Only normalize when needed: every whitespace char other than ' ' is non-printable
+    if "  " in raw or not raw.isprintable():
+        raw = _WS_RE.sub(" ", raw)
 
-    raw = re.sub(r"\s+", " ", raw.strip())
+    # Cheap substring tests gate each regex, so sensor rows run neither of them
 
     # Case 1: startup message
-    match = re.match(r"^([\S]*?)(\d{6}) (\d{1,2}):(\d{2}) LTE Setup Done", raw)
-    if match:
-        return _parse_startup_message(raw, match)
+    if "LTE Setup Done" in raw:
+        match = _STARTUP_RE.match(raw)
+        if match:
+            return _parse_startup_message(raw, match, now)
 
-    # Case 2: error message
-    match = re.match(r"^([\S]*?)(\d{6}) (\d{1,2}):(\d{2}) (E\d+)$", raw)
-    if match:
-        return _parse_error_message(raw, match)
+    # Case 2: error message (must end in 'E' followed by digits)
+    if raw[-1:].isdigit() and "E" in raw:
+        match = _ERROR_RE.match(raw)
+        if match:
+            return _parse_error_message(raw, match, now)
 
     # Case 3: sensor data (starts with a comma and has 50+ values)
-    parts = [part.strip() for part in raw.split(",")]
-    parts = parts[1:] if raw.startswith(",") else parts
-    if len(parts) >= 9 and all(re.match(r'^\d*$', p) for p in parts[1:]):  # all must be numbers except boxid (parts[0])
-        return _parse_environment_data(raw, parts)
+    body = raw[1:] if raw.startswith(",") else raw
+    _, sep, values = body.partition(",")  # values: everything after the box ID
+    if sep and values.count(",") >= 7 and _is_numeric_csv(values):  # all must be numbers except boxid
+        parts = body.split(",")  # int() tolerates padded values, only the box ID needs stripping
+        parts[0] = parts[0].strip()
+        return _parse_environment_data(raw, parts, now)
 
     # Unknown format
-    return _get_base_dict("unknown", raw)
+    return _get_base_dict("unknown", raw, now)
+
+
+def _is_numeric_csv(values: str) -> bool:
+    """
+    Checks that every comma-separated token is empty or made of ASCII digits.
+
+    Uses a single str.translate scan; tokens padded with spaces are checked one by one.
+    """
+    if " " in values:
+        return all(not p or (p.isascii() and p.isdigit()) for p in (v.strip() for v in values.split(",")))
 
+    return not values.translate(_DIGITS_COMMA)
 
-def _parse_environment_data(raw: str, parts: list) -> Dict:
+
+def _parse_environment_data(raw: str, parts: list, now: datetime) -> Dict:
     """
     Parses structured sensor data (T, RH, Noise) from a comma-separated string.
 
@@ -56,12 +85,13 @@ def _parse_environment_data(raw: str, parts: list) -> Dict:
     Args:
         raw (str): Original raw payload string.
         parts (list): Tokenized string split by commas.    
+        now (datetime): Current UTC time, used as parse time and to infer the year.
 
     Returns:
         A dictionary with datatype 'environment', and parsed info, 
         or a dictionary with parsing error info if parsing fails.
     """
-    base_dict = _get_base_dict("environment", raw)
+    base_dict = _get_base_dict("environment", raw, now)
     base_dict["box_id"] = parts[0]
 
     try:
@@ -76,7 +106,6 @@ def _parse_environment_data(raw: str, parts: list) -> Dict:
         readings = parts[5:]
 
         # Estimate readings year based on current time and month difference
-        now = datetime.now(pytz.utc)
         year = now.year
 
         # Handle edge case where readings month crosses year boundary (e.g., Dec vs Jan)
@@ -92,33 +121,34 @@ def _parse_environment_data(raw: str, parts: list) -> Dict:
         if len(readings) % 3 != 0:
             raise ValueError("Invalid environment format: number of readings non divisible by 3 (T, RH, Noise)")
 
+        values = map(int, readings)  # zipping one iterator 3 times yields consecutive triplets
         triples = [
-            {
-                "T": int(readings[i]),
-                "RH": int(readings[i + 1]),
-                "Noise": int(readings[i + 2]),
-            }
-            for i in range(0, len(readings), 3)
+            {"T": t, "RH": rh, "Noise": noise}
+            for t, rh, noise in zip(values, values, values)
         ]
 
-        return base_dict | {"timestamp": timestamp, "readings": triples}
+        base_dict["timestamp"] = timestamp
+        base_dict["readings"] = triples
+        return base_dict
 
     except Exception as e:
-        return base_dict | _get_error_dict(e)
+        base_dict.update(_get_error_dict(e))
+        return base_dict
 
 
-def _parse_error_message(raw: str, match: re.Match) -> Dict:
+def _parse_error_message(raw: str, match: re.Match, now: datetime) -> Dict:
     """
     Parses an error message containing a box ID, timestamp, and error code.
 
     Args:
         raw (str): Original raw payload string.
         match (re.Match): Match object with extracted regex groups.
+        now (datetime): Current UTC time, used as parse time.
 
     Returns:
         A dictionary with datatype 'error', and parsed info or parsing error info if parsing fails.
     """
-    base_dict = _get_base_dict("error", raw)
+    base_dict = _get_base_dict("error", raw, now)
     base_dict["box_id"] = match.group(1)
     base_dict["error_code"] = match.group(5)
 
@@ -129,24 +159,27 @@ def _parse_error_message(raw: str, match: re.Match) -> Dict:
 
         timestamp = _parse_datetime(date, hour, minute)
 
-        return base_dict | {"timestamp": timestamp}
+        base_dict["timestamp"] = timestamp
+        return base_dict
 
     except Exception as e:
-        return base_dict | _get_error_dict(e)
+        base_dict.update(_get_error_dict(e))
+        return base_dict
 
 
-def _parse_startup_message(raw: str, match: re.Match) -> Dict:
+def _parse_startup_message(raw: str, match: re.Match, now: datetime) -> Dict:
     """
     Parses a startup message containing a box ID, timestamp, and 'LTE Setup Done'.
 
     Args:
         raw (str): Original raw payload string.
         match (re.Match): Match object with extracted regex groups.
+        now (datetime): Current UTC time, used as parse time.
 
     Returns:
         A dictionary with datatype 'startup', and parsed info or parsing error info if parsing fails.
     """
-    base_dict = _get_base_dict("startup", raw)
+    base_dict = _get_base_dict("startup", raw, now)
     base_dict["box_id"] = match.group(1)
 
     try:
@@ -156,10 +189,12 @@ def _parse_startup_message(raw: str, match: re.Match) -> Dict:
 
         timestamp = _parse_datetime(date, hour, minute)
 
-        return base_dict | {"timestamp": timestamp}
+        base_dict["timestamp"] = timestamp
+        return base_dict
 
     except Exception as e:
-        return base_dict | _get_error_dict(e)
+        base_dict.update(_get_error_dict(e))
+        return base_dict
 
 
 def _parse_datetime(box_date: str, hour: int, minute: int) -> str:
@@ -178,18 +213,22 @@ def _parse_datetime(box_date: str, hour: int, minute: int) -> str:
 def _get_utc_timestamp(year, month, day, hour, minute):
     """
     Returns an ISO-formatted UTC timestamp from date and time components.
+
+    Same output as datetime(..., tzinfo=timezone.utc).isoformat(); the naive datetime
+    is only built to reject out-of-range fields with a ValueError.
     """
-    return datetime(year, month, day, hour, minute, tzinfo=timezone.utc).isoformat()
+    datetime(year, month, day, hour, minute)
+    return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:00+00:00"
 
 
-def _get_base_dict(datatype, raw, parser_version=1.0):
+def _get_base_dict(datatype, raw, now, parser_version=1.0):
     """
     Builds the base dictionary for parsed output, including type, raw input, timestamp, and version.
     """
     return {
         "datatype": datatype,
         "raw": raw,
-        "parsed_at": datetime.now(pytz.utc).isoformat(),
+        "parsed_at": now.isoformat(),
         "parser_version": parser_version,
     }
 
@@ -1,8 +1,13 @@
+import sys
 from datetime import datetime
 
+if sys.version_info >= (3, 11):
+    # fromisoformat accepts the 'Z' suffix natively since Python 3.11
+    parse_iso_datetime = datetime.fromisoformat
+else:
 
-def parse_iso_datetime(dt_str: str) -> datetime:
-    """Parses ISO 8601 with 'Z' or '+00:00' into a datetime object."""
-    if dt_str.endswith("Z"):
-        dt_str = dt_str.replace("Z", "+00:00")
-    return datetime.fromisoformat(dt_str)
+    def parse_iso_datetime(dt_str: str) -> datetime:
+        """Parses ISO 8601 with 'Z' or '+00:00' into a datetime object."""
+        if dt_str[-1:] == "Z":
+            dt_str = dt_str[:-1] + "+00:00"
+        return datetime.fromisoformat(dt_str)